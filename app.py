@@ -1,16 +1,23 @@
-from flask import Flask, render_template, jsonify
-import pandas as pd
-import numpy as np
+from flask import Flask, render_template
+import orjson
 from datetime import datetime, timedelta
+import atexit
 import os
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from operator import itemgetter
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
-import pytz
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 
 # US Central timezone
-CENTRAL_TZ = pytz.timezone('America/Chicago')
+CENTRAL_TZ = ZoneInfo('America/Chicago')
 
 load_dotenv()
 
@@ -38,9 +45,182 @@ except Exception as e:
     sp = None
     print(f"Spotify authentication error: {e}")
 
+# API responses are reused for up to this many seconds while no new plays arrive
+RESPONSE_CACHE_TIMEOUT = 60
+
+# Artist genres are effectively static, so cached rows are reused for this long
+GENRE_CACHE_TTL_DAYS = 30
+
+# Concurrent sp.artists requests when resolving uncached genres
+GENRE_FETCH_WORKERS = 8
+
+# Most read connections kept open for dashboard requests, and how many seconds a
+# request waits for one to be handed back when all of them are in use
+READER_POOL_SIZE = 4
+READER_POOL_TIMEOUT = 30
+
+# Per-connection SQLite tuning: WAL lets dashboard reads run alongside sync writes,
+# and synchronous=NORMAL is safe under WAL while skipping an fsync per commit
+SQLITE_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-64000;
+    PRAGMA mmap_size=268435456;
+"""
+
+# Schema version stored in PRAGMA user_version once migrations are done;
+# must match SCHEMA_VERSION in sync_spotify.py, whose migrate_schema runs the same steps
+SCHEMA_VERSION = 2
+SCHEMA_COLUMNS = [
+    'track_id', 'track_name', 'artist_ids', 'artist_names', 'album_id', 'album_name',
+    'release_date', 'duration_ms', 'popularity', 'genres', 'played_at'
+]
+
+def central_date(played_at):
+    """Central calendar date ('YYYY-MM-DD') of a stored played_at value (registered
+    as a SQLite function). Each value is converted with its own UTC offset, so plays
+    across a DST change land on the right day; naive values are assumed to be Central.
+    """
+    try:
+        dt = datetime.fromisoformat(played_at.replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=CENTRAL_TZ)
+        return dt.astimezone(CENTRAL_TZ).strftime('%Y-%m-%d')
+    except Exception:
+        return None
+
+def open_conn(check_same_thread=True):
+    """Open a connection to the history database with tuned PRAGMAs"""
+    conn = sqlite3.connect(DB_FILE, check_same_thread=check_same_thread)
+    conn.executescript(SQLITE_PRAGMAS)
+    conn.create_function('central_date', 1, central_date, deterministic=True)
+    return conn
+
+# Bounded pool of read connections shared by the request threads (Flask's dev
+# server starts a new thread per request, so per-thread connections never get
+# reused). Connections are opened on demand up to READER_POOL_SIZE.
+_reader_pool = queue.Queue()
+_reader_pool_lock = threading.Lock()
+_reader_pool_opened = 0
+
+@contextmanager
+def reader_conn():
+    """Borrow a pooled read connection for the duration of a with block.
+    Writes go through open_conn() instead.
+    """
+    global _reader_pool_opened
+    try:
+        conn = _reader_pool.get_nowait()
+    except queue.Empty:
+        with _reader_pool_lock:
+            can_open = _reader_pool_opened < READER_POOL_SIZE
+            if can_open:
+                _reader_pool_opened += 1
+        if can_open:
+            try:
+                # Connections move between threads, but only one uses each at a time
+                conn = open_conn(check_same_thread=False)
+            except Exception:
+                # Give the slot back, or failed opens would use up the pool
+                with _reader_pool_lock:
+                    _reader_pool_opened -= 1
+                raise
+        else:
+            try:
+                conn = _reader_pool.get(timeout=READER_POOL_TIMEOUT)
+            except queue.Empty:
+                raise sqlite3.OperationalError("timed out waiting for a pooled read connection")
+    try:
+        yield conn
+    finally:
+        _reader_pool.put(conn)
+
+@atexit.register
+def close_reader_pool():
+    """Close every pooled read connection on shutdown"""
+    while True:
+        try:
+            _reader_pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+# Split a comma-separated column of listening_history into one side-table row
+# per value, for the plays that don't have any rows there yet
+SPLIT_BACKFILL_SQL = '''
+    WITH RECURSIVE split(played_at, value, rest) AS (
+        SELECT played_at, '', COALESCE({column}, '') || ', '
+        FROM listening_history
+        WHERE played_at NOT IN (SELECT played_at FROM {table})
+        UNION ALL
+        SELECT played_at,
+               trim(substr(rest, 1, instr(rest, ', ') - 1)),
+               substr(rest, instr(rest, ', ') + 2)
+        FROM split
+        WHERE rest <> ''
+    )
+    INSERT OR IGNORE INTO {table} (played_at, {name_column})
+    SELECT played_at, value
+    FROM split
+    WHERE value <> '' AND value <> 'nan'
+'''
+
+def migrate_schema(cursor):
+    """Bring an older listening_history table up to the current columns.
+    Mirrors migrate_schema in sync_spotify.py step for step, since whichever runs
+    first records the shared SCHEMA_VERSION. Returns the columns after migrating.
+    """
+    # Rename old column names to the current ones. RENAME COLUMN needs SQLite 3.25+;
+    # without it the new column is added and the values are copied across below
+    cursor.execute("PRAGMA table_info(listening_history)")
+    existing_columns = [col[1] for col in cursor.fetchall()]
+    renames = (('track', 'track_name'), ('artist', 'artist_names'), ('album', 'album_name'))
+    for old_name, new_name in renames:
+        if old_name in existing_columns and new_name not in existing_columns:
+            try:
+                cursor.execute(f'ALTER TABLE listening_history RENAME COLUMN {old_name} TO {new_name}')
+            except sqlite3.OperationalError:
+                try:
+                    cursor.execute(f'ALTER TABLE listening_history ADD COLUMN {new_name} TEXT')
+                except sqlite3.OperationalError:
+                    pass
+    
+    cursor.execute("PRAGMA table_info(listening_history)")
+    existing_columns = [col[1] for col in cursor.fetchall()]
+    
+    # Where an old column still sits next to its replacement, fill the gaps from it
+    # so every row reads the same from the current columns
+    for old_name, new_name in renames:
+        if old_name in existing_columns and new_name in existing_columns:
+            cursor.execute(f'UPDATE listening_history SET {new_name} = COALESCE({new_name}, {old_name})')
+    
+    # Add new columns if they don't exist
+    new_columns = {
+        'track_id': 'TEXT',
+        'artist_ids': 'TEXT',
+        'album_id': 'TEXT',
+        'album_name': 'TEXT',  # In case it doesn't exist after migration
+        'duration_ms': 'INTEGER'
+    }
+    
+    for col_name, col_type in new_columns.items():
+        if col_name not in existing_columns:
+            try:
+                cursor.execute(f'ALTER TABLE listening_history ADD COLUMN {col_name} {col_type}')
+            except sqlite3.OperationalError:
+                pass
+    
+    cursor.execute("PRAGMA table_info(listening_history)")
+    existing_columns = [col[1] for col in cursor.fetchall()]
+    
+    # Record the version once every current column is in place
+    if all(col in existing_columns for col in SCHEMA_COLUMNS):
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return existing_columns
+
 def init_database():
     """Initialize SQLite database for storing listening history"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = open_conn()
     cursor = conn.cursor()
     
     # Create table with new schema
@@ -62,83 +242,222 @@ def init_database():
         )
     ''')
     
-    # Check existing columns to determine schema version
-    cursor.execute("PRAGMA table_info(listening_history)")
-    existing_columns = [col[1] for col in cursor.fetchall()]
-    
-    # Migrate old schema if needed
-    if 'track' in existing_columns and 'track_name' not in existing_columns:
-        try:
-            cursor.execute('ALTER TABLE listening_history RENAME COLUMN track TO track_name')
-        except sqlite3.OperationalError:
-            pass
-    
-    if 'artist' in existing_columns and 'artist_names' not in existing_columns:
-        try:
-            cursor.execute('ALTER TABLE listening_history RENAME COLUMN artist TO artist_names')
-        except sqlite3.OperationalError:
-            pass
-    
-    if 'album_name' not in existing_columns:
-        if 'album' in existing_columns:
-            try:
-                cursor.execute('ALTER TABLE listening_history RENAME COLUMN album TO album_name')
-            except sqlite3.OperationalError:
-                try:
-                    cursor.execute('ALTER TABLE listening_history ADD COLUMN album_name TEXT')
-                    cursor.execute('UPDATE listening_history SET album_name = album WHERE album_name IS NULL')
-                except sqlite3.OperationalError:
-                    pass
-        else:
-            try:
-                cursor.execute('ALTER TABLE listening_history ADD COLUMN album_name TEXT')
-            except sqlite3.OperationalError:
-                pass
-    
-    # Add new columns if they don't exist
-    new_columns = {
-        'track_id': 'TEXT',
-        'artist_ids': 'TEXT',
-        'album_id': 'TEXT',
-        'duration_ms': 'INTEGER'
-    }
-    
-    cursor.execute("PRAGMA table_info(listening_history)")
-    existing_columns = [col[1] for col in cursor.fetchall()]
-    
-    for col_name, col_type in new_columns.items():
-        if col_name not in existing_columns:
-            try:
-                cursor.execute(f'ALTER TABLE listening_history ADD COLUMN {col_name} {col_type}')
-            except sqlite3.OperationalError:
-                pass
+    # Column migrations only need to run until the schema is current; the version
+    # lives in the database (PRAGMA user_version), shared with sync_spotify.py
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < SCHEMA_VERSION:
+        existing_columns = migrate_schema(cursor)
+    else:
+        existing_columns = SCHEMA_COLUMNS
     
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_played_at ON listening_history(played_at)')
+    
+    # Dashboard indexes (only once the new column names are in place)
+    if 'track_name' in existing_columns and 'artist_names' in existing_columns:
+        # Covers exactly the columns the /api/stats totals and top-tracks queries read,
+        # so their 7-day window is answered from the index without touching the table.
+        # /api/data selects every column and stays on idx_played_at; per-artist counts
+        # come from track_artists
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_played_at_stats
+            ON listening_history(played_at, track_name, artist_names, popularity)
+        ''')
+        
+        # One row per (play, artist) and (play, genre) so the stats can aggregate
+        # with GROUP BY instead of re-splitting the comma-separated columns
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS track_artists (
+                played_at TEXT NOT NULL,
+                artist_name TEXT NOT NULL,
+                PRIMARY KEY (played_at, artist_name)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS track_genres (
+                played_at TEXT NOT NULL,
+                genre TEXT NOT NULL,
+                PRIMARY KEY (played_at, genre)
+            ) WITHOUT ROWID
+        ''')
+        # Normalize any plays that aren't in the side tables yet (first run, or
+        # rows written by something that doesn't maintain them)
+        cursor.execute(SPLIT_BACKFILL_SQL.format(table='track_artists', name_column='artist_name', column='artist_names'))
+        cursor.execute(SPLIT_BACKFILL_SQL.format(table='track_genres', name_column='genre', column='genres'))
+    
+    # Persistent artist -> genres cache shared across syncs
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS artist_genres (
+            artist_id TEXT PRIMARY KEY,
+            genres TEXT,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
     conn.commit()
     conn.close()
 
-def fetch_artist_genres(artist_id):
-    """Fetch genres for an artist"""
+# In-memory artist_id -> genres memo, filled from the artist_genres table or the API
+_genre_cache = {}
+
+def _chunks(items, size):
+    """Yield successive slices of at most size items"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# INSERT statements for each schema version; every variant binds the same
+# (track, artist, album, release date, popularity, genres, played_at) tuple
+INSERT_SQL_NEW_SCHEMA = '''
+    INSERT OR IGNORE INTO listening_history 
+    (track_name, artist_names, album_name, release_date, popularity, genres, played_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+# Partially migrated - has album_name but not track_name
+INSERT_SQL_ALBUM_NAME_SCHEMA = '''
+    INSERT OR IGNORE INTO listening_history 
+    (track, artist, album_name, release_date, popularity, genres, played_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+# Old schema - old column names
+INSERT_SQL_OLD_SCHEMA = '''
+    INSERT OR IGNORE INTO listening_history 
+    (track, artist, album, release_date, popularity, genres, played_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+def detect_schema():
+    """Return (has_new_schema, has_album_name) for the listening_history table"""
+    conn = open_conn()
+    columns = [col[1] for col in conn.execute("PRAGMA table_info(listening_history)")]
+    conn.close()
+    return 'track_name' in columns, 'album_name' in columns
+
+def _fetch_artists_chunk(artist_ids):
+    """Fetch up to 50 artists in one request; returns [] on error"""
     try:
-        if sp is None:
-            return []
-        artist = sp.artist(artist_id)
-        return artist.get('genres', [])
+        return sp.artists(artist_ids).get('artists', [])
     except Exception as e:
-        print(f"Error fetching genres for artist {artist_id}: {e}")
+        print(f"Error fetching genres for {len(artist_ids)} artists: {e}")
         return []
 
+def _split_names(value):
+    """Split a comma-separated artists/genres string into its non-empty values"""
+    if not value:
+        return []
+    return [name for name in (part.strip() for part in value.split(', ')) if name and name != 'nan']
+
+def _compile_insert(has_new_schema, has_album_name):
+    """Resolve the schema branch once: return the INSERT statement for this
+    schema and a function that turns a fetched track dict into its parameters
+    """
+    if has_new_schema:
+        insert_sql = INSERT_SQL_NEW_SCHEMA
+    elif has_album_name:
+        insert_sql = INSERT_SQL_ALBUM_NAME_SCHEMA
+    else:
+        insert_sql = INSERT_SQL_OLD_SCHEMA
+    row_builder = itemgetter('Track', 'Artist', 'Album', 'Release Date', 'Popularity', 'Genres', 'Played At')
+    return insert_sql, row_builder
+
+def fetch_genres_for_artists(artist_ids):
+    """Resolve genres for many artists at once.
+    Checks the in-memory memo, then the artist_genres table, and fetches the
+    rest with Spotify's multi-artist endpoint (up to 50 IDs per request).
+    Returns a dict of artist_id -> tuple of genres.
+    """
+    missing = [artist_id for artist_id in set(artist_ids) if artist_id not in _genre_cache]
+    
+    if missing:
+        ttl = f'-{GENRE_CACHE_TTL_DAYS} days'
+        with reader_conn() as conn:
+            for chunk in _chunks(missing, 500):
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT artist_id, genres FROM artist_genres "
+                    f"WHERE artist_id IN ({placeholders}) AND fetched_at >= datetime('now', ?)",
+                    (*chunk, ttl)
+                ).fetchall()
+                for artist_id, genres in rows:
+                    _genre_cache[artist_id] = tuple(g for g in (genres or '').split(', ') if g)
+        missing = [artist_id for artist_id in missing if artist_id not in _genre_cache]
+    
+    if missing and sp is not None:
+        fetched = []
+        # Chunks are independent network round-trips, so overlap them; spotipy's
+        # session already retries 429s honoring Retry-After
+        with ThreadPoolExecutor(max_workers=GENRE_FETCH_WORKERS) as executor:
+            for artists in executor.map(_fetch_artists_chunk, _chunks(missing, 50)):
+                for artist in artists:
+                    if not artist:
+                        continue
+                    genres = tuple(artist.get('genres', []))
+                    _genre_cache[artist['id']] = genres
+                    fetched.append((artist['id'], ", ".join(genres)))
+        if fetched:
+            conn = open_conn()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO artist_genres (artist_id, genres, fetched_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                        fetched
+                    )
+            finally:
+                conn.close()
+    
+    return {artist_id: _genre_cache.get(artist_id, ()) for artist_id in artist_ids}
+
+def fetch_artist_genres(artist_id):
+    """Fetch genres for a single artist (see fetch_genres_for_artists)"""
+    return fetch_genres_for_artists([artist_id])[artist_id]
+
+def spotify_timestamp_to_millis(timestamp_str):
+    """Convert a Spotify played_at timestamp ('2024-01-01T12:00:00.000Z') to UTC epoch milliseconds"""
+    return int(datetime.fromisoformat(timestamp_str.replace('Z', '+00:00')).timestamp() * 1000)
+
+def get_latest_played_at_millis():
+    """Return the newest stored play as UTC epoch milliseconds, or None if there are none.
+    Stored values mix UTC ('Z') and Central strings, so the lexical MAX can be a few
+    hours off; every value from the day before it onwards is parsed to find the real one.
+    """
+    with reader_conn() as conn:
+        latest = conn.execute("SELECT MAX(played_at) FROM listening_history").fetchone()[0]
+        if not latest:
+            return None
+        try:
+            window_start = (datetime.fromisoformat(latest[:10]) - timedelta(days=1)).strftime('%Y-%m-%d')
+        except ValueError:
+            return None
+        
+        latest_millis = None
+        for (played_at,) in conn.execute("SELECT played_at FROM listening_history WHERE played_at >= ?", (window_start,)):
+            try:
+                millis = spotify_timestamp_to_millis(played_at)
+            except ValueError:
+                continue
+            if latest_millis is None or millis > latest_millis:
+                latest_millis = millis
+    return latest_millis
+
 def fetch_recently_played_paginated(limit=50, max_batches=20):
-    """Fetch recently played tracks from Spotify API with pagination using 'before' parameter"""
+    """Fetch recently played tracks from Spotify API with pagination using 'before' parameter.
+    When the database already has plays, first asks only for plays after the newest
+    one, and stops paging back once it reaches plays that are already stored.
+    """
     if sp is None:
         return []
     
     all_tracks = []
+    first_artist_ids = []
     before_timestamp = None
+    latest_timestamp = get_latest_played_at_millis()
 
     for batch_num in range(max_batches):
         try:
-            if before_timestamp:
+            after_page = batch_num == 0 and latest_timestamp is not None
+            if after_page:
+                recently_played = sp.current_user_recently_played(limit=limit, after=latest_timestamp)
+                # A full page may not hold every new play, so walk back from now instead
+                if len(recently_played['items']) >= limit:
+                    continue
+            elif before_timestamp:
                 recently_played = sp.current_user_recently_played(limit=limit, before=before_timestamp)
             else:
                 recently_played = sp.current_user_recently_played(limit=limit)
@@ -146,7 +465,13 @@ def fetch_recently_played_paginated(limit=50, max_batches=20):
             if not recently_played['items']:
                 break
 
+            reached_existing = False
             for item in recently_played['items']:
+                # Items are newest first; everything from here on is already stored
+                if latest_timestamp is not None and spotify_timestamp_to_millis(item['played_at']) <= latest_timestamp:
+                    reached_existing = True
+                    break
+                
                 track = item['track']
                 track_name = track['name']
                 artist_name = ", ".join(artist['name'] for artist in track['artists'])
@@ -155,10 +480,8 @@ def fetch_recently_played_paginated(limit=50, max_batches=20):
                 release_date = track['album']['release_date']
                 track_popularity = track['popularity']
                 
-                # Fetch genres for the first artist
-                track_genres = []
-                if track['artists']:
-                    track_genres = fetch_artist_genres(track['artists'][0]['id'])
+                # Genres come from the first artist; resolved in bulk after paging
+                first_artist_ids.append(track['artists'][0]['id'] if track['artists'] else None)
 
                 all_tracks.append({
                     "Track": track_name,
@@ -166,13 +489,17 @@ def fetch_recently_played_paginated(limit=50, max_batches=20):
                     "Album": album_name,
                     "Release Date": release_date,
                     "Popularity": track_popularity,
-                    "Genres": ", ".join(track_genres) if track_genres else "",
+                    "Genres": "",
                     "Played At": played_at
                 })
 
+            # Stop at stored plays; a partial page after the newest stored play holds every new one
+            if reached_existing or after_page:
+                break
+
             # Use 'before' parameter with the oldest track's timestamp for next page
             if recently_played['items']:
-                oldest_timestamp = int(pd.to_datetime(recently_played['items'][-1]['played_at']).timestamp() * 1000)
+                oldest_timestamp = spotify_timestamp_to_millis(recently_played['items'][-1]['played_at'])
                 # Stop if we're trying to fetch the same batch again (no more data)
                 if before_timestamp == oldest_timestamp:
                     break
@@ -184,6 +511,12 @@ def fetch_recently_played_paginated(limit=50, max_batches=20):
             print(f"Error fetching recently played batch {batch_num + 1}: {e}")
             break
 
+    # Join genres back onto the tracks with one lookup per distinct artist
+    genres_map = fetch_genres_for_artists([a for a in first_artist_ids if a])
+    for track, artist_id in zip(all_tracks, first_artist_ids):
+        if artist_id:
+            track["Genres"] = ", ".join(genres_map[artist_id])
+
     return all_tracks
 
 def sync_spotify_data():
@@ -198,161 +531,220 @@ def sync_spotify_data():
         print("No tracks fetched from Spotify API")
         return
     
-    conn = sqlite3.connect(DB_FILE)
+    conn = open_conn()
     cursor = conn.cursor()
     
-    # Check schema once before the loop
-    cursor.execute("PRAGMA table_info(listening_history)")
-    columns = [col[1] for col in cursor.fetchall()]
-    has_new_schema = 'track_name' in columns
-    has_album_name = 'album_name' in columns
-    
+    # Most of each sync overlaps what is already stored, so look those plays
+    # up through idx_played_at and only hand the genuinely new ones to INSERT
+    incoming = [t['Played At'] for t in new_tracks]
+    existing = set()
+    for chunk in _chunks(incoming, 500):
+        placeholders = ','.join('?' * len(chunk))
+        existing.update(row[0] for row in cursor.execute(
+            f"SELECT played_at FROM listening_history WHERE played_at IN ({placeholders})", chunk))
+    new_tracks = [t for t in new_tracks if t['Played At'] not in existing]
+    
+    # Insert all rows in a single transaction (one journal flush instead of one per row)
+    # OR IGNORE still guards against duplicates within the fetched batch
     added_count = 0
-    for track in new_tracks:
-        try:
-            if has_new_schema:
-                # New schema - use all columns
-                cursor.execute('''
-                    INSERT OR IGNORE INTO listening_history 
-                    (track_name, artist_names, album_name, release_date, popularity, genres, played_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    track['Track'],
-                    track['Artist'],
-                    track['Album'],
-                    track['Release Date'],
-                    track['Popularity'],
-                    track['Genres'],
-                    track['Played At']
-                ))
-            elif has_album_name:
-                # Partially migrated - has album_name but not track_name
-                cursor.execute('''
-                    INSERT OR IGNORE INTO listening_history 
-                    (track, artist, album_name, release_date, popularity, genres, played_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    track['Track'],
-                    track['Artist'],
-                    track['Album'],
-                    track['Release Date'],
-                    track['Popularity'],
-                    track['Genres'],
-                    track['Played At']
-                ))
-            else:
-                # Old schema - use old column names
-                cursor.execute('''
-                    INSERT OR IGNORE INTO listening_history 
-                    (track, artist, album, release_date, popularity, genres, played_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    track['Track'],
-                    track['Artist'],
-                    track['Album'],
-                    track['Release Date'],
-                    track['Popularity'],
-                    track['Genres'],
-                    track['Played At']
-                ))
-            if cursor.rowcount > 0:
-                added_count += 1
-        except Exception as e:
-            print(f"Error inserting track: {e}")
+    try:
+        with conn:
+            cursor.executemany(INSERT_SQL, map(_ROW_BUILDER, new_tracks))
+            added_count = cursor.rowcount
+            if HAS_NEW_SCHEMA:
+                cursor.executemany(
+                    'INSERT OR IGNORE INTO track_artists (played_at, artist_name) VALUES (?, ?)',
+                    [(t['Played At'], name) for t in new_tracks for name in _split_names(t['Artist'])]
+                )
+                cursor.executemany(
+                    'INSERT OR IGNORE INTO track_genres (played_at, genre) VALUES (?, ?)',
+                    [(t['Played At'], name) for t in new_tracks for name in _split_names(t['Genres'])]
+                )
+    except Exception as e:
+        print(f"Error inserting tracks: {e}")
     
-    conn.commit()
     conn.close()
     print(f"Sync complete: {added_count} new tracks added to database")
 
-def get_tracks_from_db(days=7):
-    """Get tracks from database for the specified number of days"""
-    conn = sqlite3.connect(DB_FILE)
-    
+def to_central_iso(played_at):
+    """Convert a stored played_at value to a Central time ISO string.
+    Handles mixed timezones: old UTC ('Z') values and new Central values; naive
+    values are assumed to be Central. Returns None if the value can't be parsed.
+    """
+    try:
+        dt = datetime.fromisoformat(played_at.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=CENTRAL_TZ)
+    return dt.astimezone(CENTRAL_TZ).isoformat()
+
+# Dashboard field -> column for each schema version, in response order
+TRACK_FIELDS_NEW_SCHEMA = [
+    ('Track ID', 'track_id'), ('Track', 'track_name'), ('Artist IDs', 'artist_ids'),
+    ('Artist', 'artist_names'), ('Album ID', 'album_id'), ('Album', 'album_name'),
+    ('Release Date', 'release_date'), ('Duration (ms)', 'duration_ms'),
+    ('Popularity', 'popularity'), ('Genres', 'genres'), ('Played At', 'played_at')
+]
+TRACK_FIELDS_OLD_SCHEMA = [
+    ('Track', 'track'), ('Artist', 'artist'), ('Album', 'album'),
+    ('Release Date', 'release_date'), ('Popularity', 'popularity'),
+    ('Genres', 'genres'), ('Played At', 'played_at')
+]
+NUMERIC_TRACK_FIELDS = {'Duration (ms)', 'Popularity'}
+
+def get_tracks_from_db(days=7, limit=None):
+    """Get tracks from database for the specified number of days, newest first,
+    optionally capped at `limit` rows. Returns a list of JSON-ready dicts keyed
+    by dashboard field name.
+    """
     # Calculate cutoff date in Central time
     central_now = datetime.now(CENTRAL_TZ)
     cutoff_date = (central_now - timedelta(days=days)).isoformat()
     
-    # Try new schema first, fall back to old schema for migration
-    try:
-        query = '''
-            SELECT track_id, track_name, artist_ids, artist_names, album_id, album_name, 
-                   release_date, duration_ms, popularity, genres, played_at
+    fields = TRACK_FIELDS_NEW_SCHEMA if HAS_NEW_SCHEMA else TRACK_FIELDS_OLD_SCHEMA
+    select_cols = ", ".join(f'{column} AS "{field}"' for field, column in fields)
+    limit_clause = 'LIMIT ?' if limit else ''
+    params = (cutoff_date, limit) if limit else (cutoff_date,)
+    
+    with reader_conn() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(f'''
+            SELECT {select_cols}
             FROM listening_history
             WHERE played_at >= ?
             ORDER BY played_at DESC
-        '''
-        df = pd.read_sql_query(query, conn, params=(cutoff_date,))
+            {limit_clause}
+        ''', params)
         
-        if not df.empty:
-            # Map to dashboard-friendly column names
-            df.columns = ['Track ID', 'Track', 'Artist IDs', 'Artist', 'Album ID', 'Album', 
-                         'Release Date', 'Duration (ms)', 'Popularity', 'Genres', 'Played At']
-    except sqlite3.OperationalError:
-        # Fall back to old schema
-        query = '''
-            SELECT track, artist, album, release_date, popularity, genres, played_at
+        tracks = []
+        for row in cursor:
+            track = dict(row)
+            # Missing text becomes '' and missing numbers 0, as the dashboard expects
+            for field, value in track.items():
+                if value is None:
+                    track[field] = 0 if field in NUMERIC_TRACK_FIELDS else ''
+            track['Played At'] = to_central_iso(row['Played At'])
+            tracks.append(track)
+    return tracks
+
+def get_stats_from_db(days=7, top_n=10):
+    """Aggregate listening statistics for the specified number of days in SQL.
+    Returns None when there are no plays in the window.
+    """
+    # Calculate cutoff date in Central time
+    central_now = datetime.now(CENTRAL_TZ)
+    cutoff_date = (central_now - timedelta(days=days)).isoformat()
+    
+    with reader_conn() as conn:
+        total_plays, avg_popularity, unique_tracks, unique_artists = conn.execute('''
+            SELECT COUNT(*), AVG(popularity), COUNT(DISTINCT track_name), COUNT(DISTINCT artist_names)
             FROM listening_history
             WHERE played_at >= ?
-            ORDER BY played_at DESC
-        '''
-        df = pd.read_sql_query(query, conn, params=(cutoff_date,))
-        if not df.empty:
-            df.columns = ['Track', 'Artist', 'Album', 'Release Date', 'Popularity', 'Genres', 'Played At']
-    
-    conn.close()
-    
-    if df.empty:
-        return df
-    
-    # Parse timestamps - handle mixed timezones (UTC and Central)
-    def parse_timestamp(ts):
-        try:
-            dt = pd.to_datetime(ts)
-            # If it ends with 'Z', it's UTC (old format)
-            if isinstance(ts, str) and ts.endswith('Z'):
-                if dt.tzinfo is None:
-                    dt = pytz.UTC.localize(dt)
-                else:
-                    dt = dt.astimezone(pytz.UTC)
-                # Convert to Central
-                return dt.astimezone(CENTRAL_TZ)
-            else:
-                # Assume Central time (new format)
-                if dt.tzinfo is None:
-                    return CENTRAL_TZ.localize(dt)
-                else:
-                    return dt.astimezone(CENTRAL_TZ)
-        except:
-            return pd.NaT
-    
-    # Apply parsing to handle mixed timezones
-    df['Played At'] = df['Played At'].apply(parse_timestamp)
-    
-    return df
+        ''', (cutoff_date,)).fetchone()
+        
+        if not total_plays:
+            return None
+        
+        top_tracks = conn.execute('''
+            SELECT track_name, artist_names, COUNT(*) AS play_count
+            FROM listening_history
+            WHERE played_at >= ?
+            GROUP BY track_name, artist_names
+            ORDER BY play_count DESC, track_name
+            LIMIT ?
+        ''', (cutoff_date, top_n)).fetchall()
+        top_artists = conn.execute('''
+            SELECT artist_name, COUNT(*) AS count
+            FROM track_artists
+            WHERE played_at >= ?
+            GROUP BY artist_name
+            ORDER BY count DESC, artist_name
+            LIMIT ?
+        ''', (cutoff_date, top_n)).fetchall()
+        top_genres = conn.execute('''
+            SELECT genre, COUNT(*) AS count
+            FROM track_genres
+            WHERE played_at >= ?
+            GROUP BY genre
+            ORDER BY count DESC, genre
+            LIMIT ?
+        ''', (cutoff_date, top_n)).fetchall()
+        
+        # Listening activity by day (Central date). Central-format values already carry
+        # their local date; UTC ('Z') values go through central_date()
+        daily_counts = conn.execute('''
+            SELECT CASE WHEN played_at LIKE '%Z' THEN central_date(played_at)
+                        ELSE substr(played_at, 1, 10) END AS play_date,
+                   COUNT(*)
+            FROM listening_history
+            WHERE played_at >= ?
+            GROUP BY play_date
+            ORDER BY play_date
+        ''', (cutoff_date,)).fetchall()
+    
+    return {
+        'top_tracks': [
+            {'Track': track, 'Artist': artist, 'Play Count': count}
+            for track, artist, count in top_tracks
+        ],
+        'top_artists': [{'Artist': artist, 'Play Count': count} for artist, count in top_artists],
+        'genres': [{'Genre': genre, 'Count': count} for genre, count in top_genres],
+        'daily_activity': [{'Date': date, 'Count': count} for date, count in daily_counts],
+        'avg_popularity': round(float(avg_popularity), 2) if avg_popularity is not None else 0.0,
+        'unique_tracks': unique_tracks,
+        'unique_artists': unique_artists
+    }
 
-def get_last_7_days_data():
-    """Get last 7 days of listening data from database only (no API sync)"""
+def get_recent_plays(days=7, limit=15):
+    """Get the most recent plays from database only (no API sync)"""
     # Only read from database - syncing is handled by sync_spotify.py
-    df = get_tracks_from_db(days=7)
-    
-    return df
+    return get_tracks_from_db(days=days, limit=limit)
 
-def clean_for_json(obj):
-    """Recursively clean data for JSON serialization"""
-    if pd.isna(obj):
-        return None
-    elif isinstance(obj, (pd.Timestamp, pd.Timedelta)):
-        return obj.isoformat()
-    elif isinstance(obj, (int, np.integer)):
-        return int(obj)
-    elif isinstance(obj, (float, np.floating)):
-        return float(obj)
-    elif isinstance(obj, dict):
-        return {k: clean_for_json(v) for k, v in obj.items()}
-    elif isinstance(obj, (list, tuple)):
-        return [clean_for_json(item) for item in obj]
-    else:
-        return obj
+def count_plays_in_db(days=7):
+    """Count plays in the database for the specified number of days"""
+    cutoff_date = (datetime.now(CENTRAL_TZ) - timedelta(days=days)).isoformat()
+    with reader_conn() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM listening_history WHERE played_at >= ?", (cutoff_date,)
+        ).fetchone()[0]
+
+def json_response(payload, status=200):
+    """Build a JSON response with orjson (native datetime and numpy support)"""
+    return app.response_class(
+        orjson.dumps(payload, option=orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY),
+        status=status,
+        mimetype='application/json'
+    )
+
+# endpoint name -> (latest played_at, cached_at, body bytes, status); shared by
+# the request threads, so reads and writes go through the lock
+_response_cache = {}
+_response_cache_lock = threading.Lock()
+
+def cached_until_new_plays(timeout=RESPONSE_CACHE_TIMEOUT):
+    """Cache a view's JSON body for `timeout` seconds, invalidating it early as soon
+    as a newer play is synced (checked with an indexed MAX(played_at) lookup).
+    Each request gets a fresh response; error responses aren't cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with reader_conn() as conn:
+                latest = conn.execute("SELECT MAX(played_at) FROM listening_history").fetchone()[0]
+            now = time.monotonic()
+            with _response_cache_lock:
+                entry = _response_cache.get(view.__name__)
+            if entry and entry[0] == latest and now - entry[1] < timeout:
+                return app.response_class(entry[2], status=entry[3], mimetype='application/json')
+            response = view(*args, **kwargs)
+            if response.status_code == 200:
+                with _response_cache_lock:
+                    _response_cache[view.__name__] = (latest, now, response.get_data(), response.status_code)
+            return response
+        return wrapper
+    return decorator
 
 @app.route('/')
 def dashboard():
@@ -360,37 +752,20 @@ def dashboard():
     return render_template('dashboard.html')
 
 @app.route('/api/data')
+@cached_until_new_plays()
 def get_data():
-    """API endpoint to get last 7 days of listening data from database"""
+    """API endpoint to get the most recent plays and the 7-day play count from database"""
     # No need to check sp - we're reading from database only
-    df_last_7 = get_last_7_days_data()
+    recent_plays = get_recent_plays(days=7, limit=15)
     
-    if df_last_7.empty:
-        return jsonify({
+    if not recent_plays:
+        return json_response({
             'error': 'No data available for the last 7 days.'
-        }), 404
-    
-    # Replace NaN with empty string for string columns, None for others
-    df_last_7 = df_last_7.copy()
-    for col in df_last_7.columns:
-        if df_last_7[col].dtype == 'object':
-            df_last_7[col] = df_last_7[col].fillna('')
-        else:
-            df_last_7[col] = df_last_7[col].fillna(0)
-    
-    # Convert to JSON-friendly format
-    data = df_last_7.to_dict('records')
+        }, status=404)
     
-    # Clean all values for JSON serialization
-    cleaned_data = [clean_for_json(record) for record in data]
-    
-    # Limit to last 15 tracks for recent plays table
-    recent_15 = cleaned_data[:15] if len(cleaned_data) > 15 else cleaned_data
-    
-    return jsonify({
-        'data': cleaned_data,  # All data for stats
-        'recent_plays': recent_15,  # Last 15 for table
-        'total_tracks': len(df_last_7),
+    return json_response({
+        'recent_plays': recent_plays,  # Last 15 for table
+        'total_tracks': count_plays_in_db(days=7),
         'date_range': {
             'start': (datetime.now() - timedelta(days=7)).isoformat(),
             'end': datetime.now().isoformat()
@@ -398,70 +773,23 @@ def get_data():
     })
 
 @app.route('/api/stats')
+@cached_until_new_plays()
 def get_stats():
     """API endpoint to get aggregated statistics from database"""
     # No need to check sp - we're reading from database only
-    df_last_7 = get_last_7_days_data()
-    
-    if df_last_7.empty:
-        return jsonify({'error': 'No data available for the last 7 days.'}), 404
+    stats = get_stats_from_db(days=7)
     
-    # Most played tracks
-    top_tracks = df_last_7.groupby(['Track', 'Artist']).size().reset_index(name='Play Count')
-    top_tracks = top_tracks.sort_values('Play Count', ascending=False).head(10)
-    
-    # Most played artists
-    # Split artists and count individual artist plays
-    all_artists = []
-    for artists in df_last_7['Artist'].str.split(', '):
-        all_artists.extend(artists)
-    top_artists = pd.Series(all_artists).value_counts().head(10).reset_index()
-    top_artists.columns = ['Artist', 'Play Count']
-    
-    # Genre distribution - handle NaN values
-    all_genres = []
-    for genres in df_last_7['Genres'].astype(str).str.split(', '):
-        if isinstance(genres, list):
-            all_genres.extend([g.strip() for g in genres if g.strip() and g.strip() != 'nan'])
-    if all_genres:
-        genre_counts = pd.Series(all_genres).value_counts().head(10).reset_index()
-        genre_counts.columns = ['Genre', 'Count']
-    else:
-        genre_counts = pd.DataFrame(columns=['Genre', 'Count'])
+    if stats is None:
+        return json_response({'error': 'No data available for the last 7 days.'}, status=404)
     
-    # Listening activity by day
-    df_last_7['Date'] = df_last_7['Played At'].dt.date
-    daily_counts = df_last_7.groupby('Date').size().reset_index(name='Count')
-    daily_counts['Date'] = daily_counts['Date'].astype(str)
-    
-    # Popularity statistics - handle NaN
-    avg_popularity = df_last_7['Popularity'].mean()
-    if pd.isna(avg_popularity):
-        avg_popularity = 0
-    
-    # Convert DataFrames to dict, handling any NaN values
-    def clean_dict_for_json(data):
-        """Convert DataFrame records and clean all values for JSON"""
-        if data.empty:
-            return []
-        # Fill NaN values before converting
-        data = data.fillna('').copy()
-        records = data.to_dict('records')
-        # Clean each record recursively
-        return [clean_for_json(record) for record in records]
-    
-    return jsonify({
-        'top_tracks': clean_dict_for_json(top_tracks),
-        'top_artists': clean_dict_for_json(top_artists),
-        'genres': clean_dict_for_json(genre_counts),
-        'daily_activity': clean_dict_for_json(daily_counts),
-        'avg_popularity': round(float(avg_popularity), 2) if not pd.isna(avg_popularity) else 0.0,
-        'unique_tracks': int(df_last_7['Track'].nunique()),
-        'unique_artists': int(df_last_7['Artist'].nunique())
-    })
+    return json_response(stats)
 
 # Initialize database on startup
 init_database()
 
+# The schema cannot change after the startup migration, so detect it once
+HAS_NEW_SCHEMA, HAS_ALBUM_NAME = detect_schema()
+INSERT_SQL, _ROW_BUILDER = _compile_insert(HAS_NEW_SCHEMA, HAS_ALBUM_NAME)
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
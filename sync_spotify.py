@@ -4,16 +4,23 @@ Can be run manually, via cron, or via GitHub Actions.
 """
 import os
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-import pytz
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 
 # US Central timezone
-CENTRAL_TZ = pytz.timezone('America/Chicago')
-UTC_TZ = pytz.UTC
+CENTRAL_TZ = ZoneInfo('America/Chicago')
+UTC_TZ = timezone.utc
 
 load_dotenv()
 
@@ -21,88 +28,92 @@ load_dotenv()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_FILE = os.path.join(BASE_DIR, "spotify_history.db")
 
+# Per-connection SQLite tuning: WAL avoids the rollback journal's double write,
+# and synchronous=NORMAL is safe under WAL while skipping an fsync per commit
+SQLITE_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-65536;
+"""
+
+def open_conn():
+    """Open a connection to the history database with tuned PRAGMAs.
+    The connection is in autocommit mode; writers issue BEGIN/COMMIT themselves.
+    """
+    # isolation_level=None stops the sqlite3 module from opening transactions
+    # implicitly, so every write batch is exactly one explicit transaction
+    conn = sqlite3.connect(DB_FILE, isolation_level=None)
+    conn.executescript(SQLITE_PRAGMAS)
+    return conn
+
+# Bump when migrate_schema learns a new migration (stored in PRAGMA user_version);
+# app.py's migrate_schema repeats every step and must be changed and bumped with it
+SCHEMA_VERSION = 2
+SCHEMA_COLUMNS = [
+    'track_id', 'track_name', 'artist_ids', 'artist_names', 'album_id', 'album_name',
+    'release_date', 'duration_ms', 'popularity', 'genres', 'played_at'
+]
+
+# Batches at least this large (and larger than the table) drop and rebuild the
+# secondary indexes instead of updating them per row
+BULK_REINDEX_MIN_ROWS = 500
+
+# Cached artist genres older than this are fetched again from Spotify
+GENRE_CACHE_TTL_DAYS = 30
+
+# Background threads that look up a page's genres while the next page downloads
+GENRE_FETCH_WORKERS = 4
+
+# HTTPS connections kept open to the Spotify API: one per genre worker plus
+# the recently-played request paging alongside them
+HTTP_POOL_SIZE = GENRE_FETCH_WORKERS + 1
+
 # Spotify API credentials
 client_id = os.environ.get('client_id')
 client_secret = os.environ.get('client_secret')
 redirect_url = os.environ.get('redirect_url')
 scope = os.environ.get('scope')
 
-def init_database():
-    """Initialize SQLite database for storing listening history"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Create table with all metadata
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS listening_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            track_id TEXT,
-            track_name TEXT NOT NULL,
-            artist_ids TEXT,
-            artist_names TEXT NOT NULL,
-            album_id TEXT,
-            album_name TEXT,
-            release_date TEXT,
-            duration_ms INTEGER,
-            popularity INTEGER,
-            genres TEXT,
-            played_at TEXT NOT NULL UNIQUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
+def get_columns(conn):
+    """Return the set of column names in listening_history"""
+    return frozenset(col[1] for col in conn.execute("PRAGMA table_info(listening_history)"))
+
+def migrate_schema(conn):
+    """Bring an older listening_history table up to the current columns.
+    Returns the columns after migrating.
+    """
     # Check existing columns to determine schema version
-    cursor.execute("PRAGMA table_info(listening_history)")
-    existing_columns = [col[1] for col in cursor.fetchall()]
+    existing_columns = get_columns(conn)
     
     # Migrate old schema if needed (for existing databases)
     needs_migration = False
     
-    # Check if old column names exist and need renaming
-    if 'track' in existing_columns and 'track_name' not in existing_columns:
-        print("Migrating database schema: Renaming columns...")
-        try:
-            cursor.execute('ALTER TABLE listening_history RENAME COLUMN track TO track_name')
-            needs_migration = True
-        except sqlite3.OperationalError as e:
-            print(f"Migration warning (track->track_name): {e}")
-    
-    if 'artist' in existing_columns and 'artist_names' not in existing_columns:
-        try:
-            cursor.execute('ALTER TABLE listening_history RENAME COLUMN artist TO artist_names')
-            needs_migration = True
-        except sqlite3.OperationalError as e:
-            print(f"Migration warning (artist->artist_names): {e}")
-    
-    # Handle album column - add album_name if it doesn't exist
-    if 'album_name' not in existing_columns:
-        if 'album' in existing_columns:
-            # Try to rename first (SQLite 3.25.0+)
+    # Rename old column names to the current ones. RENAME COLUMN needs SQLite 3.25+;
+    # without it the new column is added and the values are copied across below
+    renames = (('track', 'track_name'), ('artist', 'artist_names'), ('album', 'album_name'))
+    for old_name, new_name in renames:
+        if old_name in existing_columns and new_name not in existing_columns:
+            print(f"Migrating database schema: Renaming {old_name} to {new_name}...")
             try:
-                cursor.execute('ALTER TABLE listening_history RENAME COLUMN album TO album_name')
+                conn.execute(f'ALTER TABLE listening_history RENAME COLUMN {old_name} TO {new_name}')
                 needs_migration = True
-                print("Renamed album to album_name")
             except sqlite3.OperationalError:
-                # If rename fails, add new column and copy data
                 try:
-                    cursor.execute('ALTER TABLE listening_history ADD COLUMN album_name TEXT')
-                    cursor.execute('UPDATE listening_history SET album_name = album WHERE album_name IS NULL')
+                    conn.execute(f'ALTER TABLE listening_history ADD COLUMN {new_name} TEXT')
                     needs_migration = True
-                    print("Added album_name column and copied data from album")
                 except sqlite3.OperationalError as e:
-                    print(f"Warning: Could not migrate album column: {e}")
-        else:
-            # No album column at all, just add album_name
-            try:
-                cursor.execute('ALTER TABLE listening_history ADD COLUMN album_name TEXT')
-                needs_migration = True
-                print("Added album_name column")
-            except sqlite3.OperationalError as e:
-                print(f"Warning: Could not add album_name column: {e}")
+                    print(f"Migration warning ({old_name}->{new_name}): {e}")
     
     # Refresh column list after renaming
-    cursor.execute("PRAGMA table_info(listening_history)")
-    existing_columns = [col[1] for col in cursor.fetchall()]
+    existing_columns = get_columns(conn)
+    
+    # Where an old column still sits next to its replacement, fill the gaps from it
+    # so every row reads the same from the current columns
+    for old_name, new_name in renames:
+        if old_name in existing_columns and new_name in existing_columns:
+            conn.execute(f'UPDATE listening_history SET {new_name} = COALESCE({new_name}, {old_name})')
+            needs_migration = True
     
     # Add new columns if they don't exist
     new_columns = {
@@ -117,7 +128,7 @@ def init_database():
         if col_name not in existing_columns:
             try:
                 print(f"Adding column: {col_name}")
-                cursor.execute(f'ALTER TABLE listening_history ADD COLUMN {col_name} {col_type}')
+                conn.execute(f'ALTER TABLE listening_history ADD COLUMN {col_name} {col_type}')
                 needs_migration = True
             except sqlite3.OperationalError as e:
                 print(f"Warning: Could not add column {col_name}: {e}")
@@ -125,111 +136,219 @@ def init_database():
     if needs_migration:
         print("Database migration completed")
     
-    # Create indexes for faster queries (only on columns that exist)
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_played_at ON listening_history(played_at)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON listening_history(created_at)')
+    # Record the version once every current column is in place
+    columns_after = get_columns(conn)
+    if columns_after.issuperset(SCHEMA_COLUMNS):
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return columns_after
+
+def init_database(conn):
+    """Initialize SQLite database for storing listening history on the given connection.
+    Returns the set of listening_history columns, so callers don't have to look again.
+    """
+    # Table creation, migrations and indexes are committed together
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        columns = create_schema(conn)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return columns
+
+def create_schema(conn):
+    """Create or migrate the tables and indexes; runs inside init_database's transaction"""
+    # Create table with all metadata
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS listening_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            track_id TEXT,
+            track_name TEXT NOT NULL,
+            artist_ids TEXT,
+            artist_names TEXT NOT NULL,
+            album_id TEXT,
+            album_name TEXT,
+            release_date TEXT,
+            duration_ms INTEGER,
+            popularity INTEGER,
+            genres TEXT,
+            played_at TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Column migrations only need to run until the schema is current; the
+    # version is stored in the database so later runs skip the introspection
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        columns = migrate_schema(conn)
+    else:
+        columns = get_columns(conn)
+    
+    # Create indexes for faster queries
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_played_at ON listening_history(played_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON listening_history(created_at)')
     
     # Only create track_id index if column exists
-    cursor.execute("PRAGMA table_info(listening_history)")
-    columns_after = [col[1] for col in cursor.fetchall()]
-    if 'track_id' in columns_after:
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_track_id ON listening_history(track_id)')
+    if 'track_id' in columns:
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_track_id ON listening_history(track_id)')
     
-    conn.commit()
-    conn.close()
+    # Persistent artist -> genres cache shared across sync runs
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS artist_genres (
+            artist_id TEXT PRIMARY KEY,
+            genres TEXT,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Per-play artist/genre rows used by the dashboard stats (app.py backfills
+    # anything that predates them)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS track_artists (
+            played_at TEXT NOT NULL,
+            artist_name TEXT NOT NULL,
+            PRIMARY KEY (played_at, artist_name)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS track_genres (
+            played_at TEXT NOT NULL,
+            genre TEXT NOT NULL,
+            PRIMARY KEY (played_at, genre)
+        ) WITHOUT ROWID
+    ''')
+    
+    return columns
+
+def split_names(value):
+    """Split a comma-separated artists/genres string into its non-empty values"""
+    if not value:
+        return []
+    return [name for name in (part.strip() for part in value.split(', ')) if name and name != 'nan']
 
-def fetch_artist_genres(sp, artist_id):
-    """Fetch genres for an artist"""
+# In-memory artist_id -> genres memo, filled from the artist_genres table or the API
+_genre_cache = {}
+
+def fetch_artists_chunk(sp, artist_ids):
+    """Fetch up to 50 artists in one request; returns [] on error.
+    Rate limiting (429) is retried by the HTTP session, honoring Retry-After.
+    """
     try:
-        artist = sp.artist(artist_id)
-        return artist.get('genres', [])
+        return sp.artists(artist_ids).get('artists', [])
     except Exception as e:
-        print(f"Error fetching genres for artist {artist_id}: {e}")
+        print(f"Error fetching genres for {len(artist_ids)} artists: {e}")
         return []
 
-def fetch_recently_played_paginated(sp, limit=50, max_batches=50, skip_genres=False):
-    """Fetch recently played tracks from Spotify API with pagination
-    Fetches ALL available tracks, not just 50. Continues until no more data.
+def save_artist_genres(cursor, rows):
+    """Store (artist_id, genres) rows in the artist_genres cache table"""
+    cursor.executemany(
+        "INSERT OR REPLACE INTO artist_genres (artist_id, genres, fetched_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+        rows
+    )
+
+def load_cached_genres(conn, artist_ids):
+    """Fill the in-memory memo from the artist_genres table.
+    Returns the IDs that still have to be fetched from the API.
     """
-    print(f"Fetching recently played tracks (limit={limit}, max_batches={max_batches}, skip_genres={skip_genres})...")
-    all_tracks = []
-    before_timestamp = None
-    total_fetched = 0
+    missing = [artist_id for artist_id in artist_ids if artist_id not in _genre_cache]
+    # Reuse genres fetched by earlier runs (500 IDs per query stays under SQLite's variable limit)
+    for i in range(0, len(missing), 500):
+        chunk = missing[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT artist_id, genres FROM artist_genres "
+            f"WHERE artist_id IN ({placeholders}) AND fetched_at >= datetime('now', ?)",
+            (*chunk, f'-{GENRE_CACHE_TTL_DAYS} days')
+        )
+        for artist_id, genres in rows:
+            _genre_cache[artist_id] = [g for g in (genres or '').split(', ') if g]
+    return [artist_id for artist_id in missing if artist_id not in _genre_cache]
 
-    for batch_num in range(max_batches):
-        print(f"Fetching batch {batch_num + 1}/{max_batches}...")
-        try:
-            if before_timestamp:
-                recently_played = sp.current_user_recently_played(limit=limit, before=before_timestamp)
-            else:
-                recently_played = sp.current_user_recently_played(limit=limit)
+def remember_artists(artists):
+    """Memoize the genres from a multi-artist response; returns their (artist_id, genres) rows"""
+    fetched = []
+    for artist in artists:
+        if artist:
+            genres = artist.get('genres', [])
+            _genre_cache[artist['id']] = genres
+            fetched.append((artist['id'], ", ".join(genres)))
+    return fetched
 
-            if not recently_played['items']:
-                break
+def queue_genre_lookup(executor, sp, conn, artist_ids, queued_ids, futures):
+    """Start background genre requests for the artists that haven't been queued yet.
+    The artist_genres table is checked here through conn; only the API requests
+    (50 IDs each, so one per page) run on the executor.
+    """
+    new_ids = [artist_id for artist_id in dict.fromkeys(artist_ids) if artist_id and artist_id not in queued_ids]
+    if new_ids:
+        queued_ids.update(new_ids)
+        missing = load_cached_genres(conn, new_ids)
+        for i in range(0, len(missing), 50):
+            futures.append(executor.submit(fetch_artists_chunk, sp, missing[i:i + 50]))
 
-            for item in recently_played['items']:
-                track = item['track']
-                track_id = track.get('id', '')
-                track_name = track['name']
-                artist_ids = ",".join([artist['id'] for artist in track['artists']])
-                artist_names = ", ".join([artist['name'] for artist in track['artists']])
-                played_at = item['played_at']
-                album_id = track['album'].get('id', '')
-                album_name = track['album']['name']
-                release_date = track['album'].get('release_date', '')
-                duration_ms = track.get('duration_ms', 0)
-                track_popularity = track.get('popularity', 0)
-                
-                # Fetch genres for the first artist (skip if requested to speed up)
-                track_genres = []
-                if not skip_genres and track['artists']:
-                    try:
-                        track_genres = fetch_artist_genres(sp, track['artists'][0]['id'])
-                    except Exception as e:
-                        print(f"Warning: Could not fetch genres for {track_name}: {e}")
-
-                all_tracks.append({
-                    "track_id": track_id,
-                    "track_name": track_name,
-                    "artist_ids": artist_ids,
-                    "artist_names": artist_names,
-                    "album_id": album_id,
-                    "album_name": album_name,
-                    "release_date": release_date,
-                    "duration_ms": duration_ms,
-                    "popularity": track_popularity,
-                    "genres": ", ".join(track_genres) if track_genres else "",
-                    "played_at": played_at
-                })
-
-            # Use 'before' parameter with the oldest track's timestamp for next page
-            if recently_played['items']:
-                oldest_timestamp = int(pd.to_datetime(recently_played['items'][-1]['played_at']).timestamp() * 1000)
-                if before_timestamp == oldest_timestamp:
-                    print(f"No more data available (reached end of history)")
-                    break
-                before_timestamp = oldest_timestamp
-                total_fetched += len(recently_played['items'])
-                print(f"Batch {batch_num + 1}: Fetched {len(recently_played['items'])} tracks (total: {total_fetched})")
-            else:
-                print(f"No more items in batch {batch_num + 1}")
-                break
-                
-        except Exception as e:
-            print(f"Error fetching recently played batch {batch_num + 1}: {e}")
-            break
+def new_track_columns():
+    """Return an empty batch of fetched tracks: one list per listening_history column"""
+    return {column: [] for column in SCHEMA_COLUMNS}
 
-    print(f"Total tracks fetched from API: {len(all_tracks)}")
-    return all_tracks
+def add_page_tracks(tracks, first_artist_ids, items, convert_played_at=None):
+    """Append a page of recently-played items to the column batch.
+    Records each track's first artist ID (or None) in first_artist_ids for the genre lookup,
+    and passes played_at through convert_played_at when one is given.
+    """
+    # Bind the column appends once per page rather than looking them up per field per track
+    add_track_id = tracks['track_id'].append
+    add_track_name = tracks['track_name'].append
+    add_artist_ids = tracks['artist_ids'].append
+    add_artist_names = tracks['artist_names'].append
+    add_album_id = tracks['album_id'].append
+    add_album_name = tracks['album_name'].append
+    add_release_date = tracks['release_date'].append
+    add_duration_ms = tracks['duration_ms'].append
+    add_popularity = tracks['popularity'].append
+    add_played_at = tracks['played_at'].append
+    add_first_artist_id = first_artist_ids.append
+    
+    for item in items:
+        track = item['track']
+        track_get = track.get
+        album = track['album']
+        # One pass over the artists builds both the ID and name lists
+        ids, names = [], []
+        for artist in track['artists']:
+            ids.append(artist['id'])
+            names.append(artist['name'])
+        
+        add_track_id(track_get('id', ''))
+        add_track_name(track['name'])
+        add_artist_ids(",".join(ids))
+        add_artist_names(", ".join(names))
+        add_album_id(album.get('id', ''))
+        add_album_name(album['name'])
+        add_release_date(album.get('release_date', ''))
+        add_duration_ms(track_get('duration_ms', 0))
+        add_popularity(track_get('popularity', 0))
+        played_at = item['played_at']
+        add_played_at(convert_played_at(played_at) if convert_played_at else played_at)
+        add_first_artist_id(ids[0] if ids else None)
+
+def apply_genres(tracks, first_artist_ids, futures):
+    """Wait for the queued genre requests and fill in the batch's genres column.
+    Returns the (artist_id, genres) rows fetched from the API, for save_artist_genres.
+    """
+    fetched = []
+    for future in futures:
+        fetched.extend(remember_artists(future.result()))
+    tracks['genres'] = [", ".join(_genre_cache.get(artist_id, [])) for artist_id in first_artist_ids]
+    return fetched
 
 def convert_to_central(utc_timestamp_str):
     """Convert UTC timestamp string to US Central timezone"""
     try:
-        # Parse the UTC timestamp from Spotify (ISO format)
-        utc_dt = pd.to_datetime(utc_timestamp_str)
+        # Parse the UTC timestamp from Spotify (ISO format; 'Z' spelled out for Python 3.9)
+        utc_dt = datetime.fromisoformat(utc_timestamp_str.replace('Z', '+00:00'))
         # Ensure it's timezone-aware (UTC)
         if utc_dt.tzinfo is None:
-            utc_dt = UTC_TZ.localize(utc_dt)
+            utc_dt = utc_dt.replace(tzinfo=UTC_TZ)
         else:
             utc_dt = utc_dt.astimezone(UTC_TZ)
         # Convert to Central time
@@ -240,43 +359,33 @@ def convert_to_central(utc_timestamp_str):
         print(f"Warning: Could not convert timestamp {utc_timestamp_str}: {e}")
         return utc_timestamp_str  # Return original if conversion fails
 
-def get_latest_played_at():
+def get_latest_played_at(conn):
     """Get the most recent played_at timestamp from database.
     Returns the raw timestamp string (could be UTC or Central).
     """
-    if not os.path.exists(DB_FILE):
-        return None
-    
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute("SELECT MAX(played_at) FROM listening_history")
-        result = cursor.fetchone()
-        latest = result[0] if result and result[0] else None
-        return latest
+        result = conn.execute("SELECT MAX(played_at) FROM listening_history").fetchone()
+        return result[0] if result and result[0] else None
     except sqlite3.OperationalError:
         return None
-    finally:
-        conn.close()
 
 def parse_timestamp_to_utc_millis(timestamp_str):
     """Parse a timestamp string (UTC or Central) and return UTC milliseconds for API comparison"""
     try:
-        # Parse the timestamp
-        dt = pd.to_datetime(timestamp_str)
+        # Parse the timestamp ('Z' spelled out for Python 3.9)
+        dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
         
         # If it ends with 'Z', it's UTC
         if timestamp_str.endswith('Z') or '+00:00' in timestamp_str:
             # Already UTC
             if dt.tzinfo is None:
-                dt = UTC_TZ.localize(dt)
+                dt = dt.replace(tzinfo=UTC_TZ)
             else:
                 dt = dt.astimezone(UTC_TZ)
         else:
             # Assume it's Central time (new format)
             if dt.tzinfo is None:
-                dt = CENTRAL_TZ.localize(dt)
+                dt = dt.replace(tzinfo=CENTRAL_TZ)
             else:
                 dt = dt.astimezone(CENTRAL_TZ)
             # Convert to UTC
@@ -287,13 +396,15 @@ def parse_timestamp_to_utc_millis(timestamp_str):
         print(f"Warning: Could not parse timestamp {timestamp_str}: {e}")
         return None
 
-def fetch_new_tracks_only(sp, skip_genres=False):
-    """Fetch only NEW tracks that aren't in the database yet.
-    Stops when we encounter songs we already have.
+def fetch_new_tracks_only(sp, conn, skip_genres=False):
+    """Fetch ONLY the new tracks that aren't in the database yet.
+    Stops when we encounter songs we already have. Each page's genres are looked up
+    in the background while the next page is requested.
+    Returns (rows in SCHEMA_COLUMNS order, (artist_id, genres) rows fetched from the API).
     """
     print("=" * 60)
     print("Checking database for latest song...")
-    latest_played_at = get_latest_played_at()
+    latest_played_at = get_latest_played_at(conn)
     
     if latest_played_at:
         print(f"✓ Latest song in database: {latest_played_at}")
@@ -309,100 +420,120 @@ def fetch_new_tracks_only(sp, skip_genres=False):
         latest_timestamp = None
     print("=" * 60)
     
-    all_tracks = []
     before_timestamp = None
-    found_existing = False
+    total_new = 0
+    # Column-oriented batch: each field is its own list, in the same track order
+    tracks = new_track_columns()
+    first_artist_ids = []
+    
+    # Each page's genres are fetched in the background while the next page is requested
+    genre_executor = None if skip_genres else ThreadPoolExecutor(max_workers=GENRE_FETCH_WORKERS)
+    genre_futures = []
+    queued_artist_ids = set()
     
     print("Fetching new tracks from Spotify...")
     
-    # Fetch in batches until we hit songs we already have
-    for batch_num in range(50):  # Max 50 batches (2500 songs)
-        try:
-            if before_timestamp:
-                recently_played = sp.current_user_recently_played(limit=50, before=before_timestamp)
-            else:
-                recently_played = sp.current_user_recently_played(limit=50)
-            
-            if not recently_played['items']:
-                print(f"Batch {batch_num + 1}: No more items from Spotify API")
-                break
-            
-            batch_new_count = 0
-            for item in recently_played['items']:
-                played_at = item['played_at']
-                played_timestamp = int(pd.to_datetime(played_at).timestamp() * 1000)
+    try:
+        # Fetch in batches until we hit songs we already have
+        for batch_num in range(50):  # Max 50 batches (2500 songs)
+            done = False
+            try:
+                if before_timestamp:
+                    recently_played = sp.current_user_recently_played(limit=50, before=before_timestamp)
+                else:
+                    recently_played = sp.current_user_recently_played(limit=50)
                 
-                # If we've reached songs we already have, stop
-                if latest_timestamp and played_timestamp <= latest_timestamp:
-                    print(f"Reached existing songs in batch {batch_num + 1}")
-                    print(f"  API song timestamp (UTC): {played_timestamp}")
-                    print(f"  Database latest (UTC): {latest_timestamp}")
-                    print(f"  Difference: {latest_timestamp - played_timestamp} ms")
-                    found_existing = True
+                if not recently_played['items']:
+                    print(f"Batch {batch_num + 1}: No more items from Spotify API")
                     break
                 
-                # This is a new song - process it
-                track = item['track']
-                track_id = track.get('id', '')
-                track_name = track['name']
-                artist_ids = ",".join([artist['id'] for artist in track['artists']])
-                artist_names = ", ".join([artist['name'] for artist in track['artists']])
-                album_id = track['album'].get('id', '')
-                album_name = track['album']['name']
-                release_date = track['album'].get('release_date', '')
-                duration_ms = track.get('duration_ms', 0)
-                track_popularity = track.get('popularity', 0)
+                # Parse the whole page's timestamps to UTC milliseconds in one vectorized call
+                page_millis = pd.to_datetime(
+                    [item['played_at'] for item in recently_played['items']], utc=True, format='ISO8601'
+                ).as_unit('ms').asi8
                 
-                # Convert played_at from UTC to Central time
-                played_at_central = convert_to_central(played_at)
+                # Spotify returns plays newest first, so the new songs are a prefix of the page.
+                # Negating the timestamps makes them ascending for a binary search of the
+                # first play at or before the latest one we already have
+                stop = len(page_millis)
+                if latest_timestamp:
+                    stop = int(np.searchsorted(-page_millis, -latest_timestamp, side='left'))
+                    if stop < len(page_millis):
+                        played_timestamp = int(page_millis[stop])
+                        print(f"Reached existing songs in batch {batch_num + 1}")
+                        print(f"  API song timestamp (UTC): {played_timestamp}")
+                        print(f"  Database latest (UTC): {latest_timestamp}")
+                        print(f"  Difference: {latest_timestamp - played_timestamp} ms")
+                        done = True
                 
-                # Fetch genres (skip in CI to speed up)
-                track_genres = []
-                if not skip_genres and track['artists']:
-                    try:
-                        track_genres = fetch_artist_genres(sp, track['artists'][0]['id'])
-                    except Exception as e:
-                        pass  # Skip genre fetch on error
+                # These are the new songs; played_at is stored in Central time and
+                # genres come from the first artist, looked up in the background
+                page_start = len(first_artist_ids)
+                add_page_tracks(tracks, first_artist_ids, recently_played['items'][:stop],
+                                convert_played_at=convert_to_central)
                 
-                all_tracks.append({
-                    "track_id": track_id,
-                    "track_name": track_name,
-                    "artist_ids": artist_ids,
-                    "artist_names": artist_names,
-                    "album_id": album_id,
-                    "album_name": album_name,
-                    "release_date": release_date,
-                    "duration_ms": duration_ms,
-                    "popularity": track_popularity,
-                    "genres": ", ".join(track_genres) if track_genres else "",
-                    "played_at": played_at_central  # Store in Central time
-                })
-                batch_new_count += 1
-            
-            if found_existing:
-                print(f"⏹️  Stopping fetch - reached existing songs.")
-                print(f"   Total new songs found: {len(all_tracks)}")
-                break
-            
-            print(f"✓ Batch {batch_num + 1}: Found {batch_new_count} new songs (total so far: {len(all_tracks)})")
-            
-            # Get timestamp for next batch
-            if recently_played['items']:
-                oldest_timestamp = int(pd.to_datetime(recently_played['items'][-1]['played_at']).timestamp() * 1000)
+                if genre_executor:
+                    queue_genre_lookup(genre_executor, sp, conn, first_artist_ids[page_start:], queued_artist_ids, genre_futures)
+                page_new = len(first_artist_ids) - page_start
+                total_new += page_new
+                
+                if done:
+                    print(f"⏹️  Stopping fetch - reached existing songs.")
+                    print(f"   Total new songs found: {total_new}")
+                    break
+                print(f"✓ Batch {batch_num + 1}: Found {page_new} new songs (total so far: {total_new})")
+                
+                # Get timestamp for next batch
+                oldest_timestamp = int(page_millis[-1])
                 if before_timestamp == oldest_timestamp:
                     break
                 before_timestamp = oldest_timestamp
-            else:
-                break
                 
-        except Exception as e:
-            print(f"❌ Error fetching batch {batch_num + 1}: {e}")
-            import traceback
-            traceback.print_exc()
-            break
+            except Exception as e:
+                print(f"❌ Error fetching batch {batch_num + 1}: {e}")
+                import traceback
+                traceback.print_exc()
+                break
+        
+        # Genres for the first artists (left empty in CI to speed up)
+        genre_rows = apply_genres(tracks, first_artist_ids, genre_futures)
+    finally:
+        if genre_executor:
+            genre_executor.shutdown()
     
-    print(f"✓ Fetch complete: Found {len(all_tracks)} new tracks total")
-    return all_tracks
+    print(f"✓ Fetch complete: Found {total_new} new tracks total")
+    return list(zip(*(tracks[column] for column in SCHEMA_COLUMNS))), genre_rows
+
+@lru_cache(maxsize=None)
+def find_oauth_cache():
+    """Return the OAuth cache file in the working directory ('.cache' first, else
+    the first '.cache-*'), or None. Scans the directory once per process.
+    """
+    fallback = None
+    with os.scandir('.') as entries:
+        for entry in entries:
+            if entry.name == '.cache' and entry.is_file():
+                return entry.name
+            if fallback is None and entry.name.startswith('.cache-') and entry.is_file():
+                fallback = entry.name
+    return fallback
+
+def build_http_session():
+    """Build the pooled requests session handed to the Spotify client.
+    A custom session replaces the one spotipy would build, so it carries the retries too.
+    """
+    session = requests.Session()
+    # The only retry policy for API calls: 429s wait out Spotify's Retry-After
+    # header (urllib3 honors it for the statuses in status_forcelist)
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE'])
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount('https://', adapter)
+    return session
 
 def sync_spotify_data():
     """Sync new tracks from Spotify API to database - only adds NEW songs"""
@@ -428,10 +559,8 @@ def sync_spotify_data():
         cache_path = None
         if is_ci:
             # Look for any .cache or .cache-* file in the repo
-            import glob
-            cache_files = glob.glob('.cache') + glob.glob('.cache-*')
-            if cache_files:
-                cache_path = cache_files[0]
+            cache_path = find_oauth_cache()
+            if cache_path:
                 print(f"✓ Found cache file: {cache_path}")
             else:
                 print("=" * 60)
@@ -489,7 +618,8 @@ def sync_spotify_data():
         
         # Test the connection
         print("Creating Spotify client...")
-        sp = spotipy.Spotify(auth_manager=auth_manager)
+        # Reuse pooled connections instead of a new TLS handshake per API call
+        sp = spotipy.Spotify(auth_manager=auth_manager, requests_session=build_http_session())
         
         # Quick test to verify authentication works
         print("Testing authentication with API call...")
@@ -506,105 +636,103 @@ def sync_spotify_data():
         traceback.print_exc()
         return
     
-    # Initialize database
-    init_database()
+    # One connection serves the whole sync: setup, the latest-play lookup and the inserts
+    conn = open_conn()
     
-    # Fetch ONLY new tracks (stops when it hits existing songs)
-    new_tracks = fetch_new_tracks_only(sp, skip_genres=is_ci)
+    # Initialize database
+    columns = init_database(conn)
+    if not columns.issuperset(SCHEMA_COLUMNS):
+        conn.close()
+        print(f"ERROR: Database migration incomplete, missing columns: {sorted(set(SCHEMA_COLUMNS) - columns)}")
+        return
     
-    if not new_tracks:
+    # init_database normalized the table to the current columns, so one
+    # statement and one row shape cover every database
+    fields = SCHEMA_COLUMNS
+    insert_sql = f"INSERT OR IGNORE INTO listening_history ({', '.join(fields)})"
+    played_at_index = fields.index('played_at')
+    artist_names_index = fields.index('artist_names')
+    genres_index = fields.index('genres')
+    
+    # Many rows per INSERT ... VALUES (...), (...) statement, staying under
+    # SQLite's 999 bound-parameter limit (81 rows of 11 columns)
+    row_placeholder = "(" + ", ".join("?" * len(fields)) + ")"
+    rows_per_statement = 900 // len(fields)
+    
+    # Fetch ONLY new tracks (stops when it hits existing songs). Every page is
+    # fetched before the write transaction opens, so the write lock isn't held
+    # while the API is paged over the network
+    new_rows, genre_rows = fetch_new_tracks_only(sp, conn, skip_genres=is_ci)
+    
+    if not new_rows:
+        conn.close()
         print("=" * 60)
         print("INFO: No new tracks found - database is up to date!")
         print("This means all recent songs are already in the database.")
         print("=" * 60)
         return
     
-    print(f"Found {len(new_tracks)} new tracks to add")
-    
-    # Save to database
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Check schema once before the loop (more efficient)
-    cursor.execute("PRAGMA table_info(listening_history)")
-    columns = [col[1] for col in cursor.fetchall()]
-    has_new_schema = 'track_name' in columns
-    has_album_name = 'album_name' in columns
-    
-    print(f"Database schema: new_schema={has_new_schema}, has_album_name={has_album_name}")
-    
     added_count = 0
     skipped_count = 0
-    
-    for track in new_tracks:
-        try:
-            # Use played_at as the unique identifier (Spotify provides exact timestamp)
-            if has_new_schema:
-                # New schema - use all columns
-                cursor.execute('''
-                    INSERT OR IGNORE INTO listening_history 
-                    (track_id, track_name, artist_ids, artist_names, album_id, album_name, 
-                     release_date, duration_ms, popularity, genres, played_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    track['track_id'],
-                    track['track_name'],
-                    track['artist_ids'],
-                    track['artist_names'],
-                    track['album_id'],
-                    track['album_name'],
-                    track['release_date'],
-                    track['duration_ms'],
-                    track['popularity'],
-                    track['genres'],
-                    track['played_at']
-                ))
-            elif has_album_name:
-                # Partially migrated - has album_name but not track_name
-                cursor.execute('''
-                    INSERT OR IGNORE INTO listening_history 
-                    (track, artist, album_name, release_date, popularity, genres, played_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    track['track_name'],
-                    track['artist_names'],
-                    track['album_name'],
-                    track['release_date'],
-                    track['popularity'],
-                    track['genres'],
-                    track['played_at']
-                ))
-            else:
-                # Old schema - use old column names (album instead of album_name)
-                cursor.execute('''
-                    INSERT OR IGNORE INTO listening_history 
-                    (track, artist, album, release_date, popularity, genres, played_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    track['track_name'],
-                    track['artist_names'],
-                    track['album_name'],
-                    track['release_date'],
-                    track['popularity'],
-                    track['genres'],
-                    track['played_at']
-                ))
+    fetched_count = 0
+    cursor = conn.cursor()
+    try:
+        existing_count = cursor.execute("SELECT COUNT(*) FROM listening_history").fetchone()[0]
+        
+        # One explicit transaction for the whole batch, committed below and rolled
+        # back on error. IMMEDIATE takes the write lock up front, so a dashboard sync
+        # writing at the same time makes this wait at BEGIN instead of failing halfway through.
+        # The fetched genres are saved in the same transaction
+        cursor.execute('BEGIN IMMEDIATE')
+        
+        dropped_indexes = []
+        reindexing = False
+        for start in range(0, len(new_rows), rows_per_statement):
+            chunk = new_rows[start:start + rows_per_statement]
+            # Use played_at as the unique identifier (Spotify provides exact timestamp);
+            # duplicates are ignored by the UNIQUE constraint
+            values = ", ".join([row_placeholder] * len(chunk))
+            cursor.execute(f"{insert_sql} VALUES {values}", list(chain.from_iterable(chunk)))
+            added_count += cursor.rowcount
+            fetched_count += len(chunk)
             
-            if cursor.rowcount > 0:
-                added_count += 1
-            else:
-                skipped_count += 1
-        except sqlite3.IntegrityError:
-            # Duplicate played_at (already handled by UNIQUE constraint)
-            skipped_count += 1
-        except Exception as e:
-            print(f"Error inserting track {track.get('track_name', 'Unknown')}: {e}")
+            cursor.executemany(
+                'INSERT OR IGNORE INTO track_artists (played_at, artist_name) VALUES (?, ?)',
+                [(row[played_at_index], name) for row in chunk for name in split_names(row[artist_names_index])]
+            )
+            cursor.executemany(
+                'INSERT OR IGNORE INTO track_genres (played_at, genre) VALUES (?, ?)',
+                [(row[played_at_index], name) for row in chunk for name in split_names(row[genres_index])]
+            )
+            
+            # Once a backfill has outgrown the table it started with, the rest of it is
+            # cheaper with the secondary indexes rebuilt once at the end than updated
+            # row by row. The UNIQUE index on played_at is kept, since OR IGNORE relies on it
+            if not reindexing and fetched_count >= BULK_REINDEX_MIN_ROWS and fetched_count > existing_count:
+                reindexing = True
+                dropped_indexes = cursor.execute(
+                    "SELECT name, sql FROM sqlite_master "
+                    "WHERE type = 'index' AND tbl_name = 'listening_history' AND sql IS NOT NULL"
+                ).fetchall()
+                print(f"Large backfill: rebuilding {len(dropped_indexes)} indexes after the insert")
+                for name, _ in dropped_indexes:
+                    cursor.execute(f'DROP INDEX "{name}"')
+        
+        for _, index_sql in dropped_indexes:
+            cursor.execute(index_sql)
+        if genre_rows:
+            save_artist_genres(cursor, genre_rows)
+        cursor.execute('COMMIT')
+        skipped_count = fetched_count - added_count
+    except Exception as e:
+        if conn.in_transaction:
+            cursor.execute('ROLLBACK')
+        added_count = 0
+        print(f"Error inserting tracks: {e}")
     
     # Get total count before closing
-    cursor.execute("SELECT COUNT(*) FROM listening_history")
-    total_count = cursor.fetchone()[0]
+    total_count = cursor.execute("SELECT COUNT(*) FROM listening_history").fetchone()[0]
     
-    conn.commit()
     conn.close()
     
     print("=" * 60)
@@ -1,67 +1,176 @@
 """
 Database Viewer - View your Spotify listening history in a table format
 """
+import atexit
 import sqlite3
-import pandas as pd
-from datetime import datetime
-import pytz
+from datetime import datetime, timedelta
+from collections import namedtuple
+from functools import lru_cache
+from zoneinfo import ZoneInfo
 import os
+import re
+import subprocess
 
 # US Central timezone
-CENTRAL_TZ = pytz.timezone('America/Chicago')
-UTC_TZ = pytz.UTC
+CENTRAL_TZ = ZoneInfo('America/Chicago')
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_FILE = os.path.join(BASE_DIR, "spotify_history.db")
 
-def view_database(limit=100, days=None):
-    """View listening history from database"""
-    
-    if not os.path.exists(DB_FILE):
-        print(f"Database file not found: {DB_FILE}")
-        return
-    
-    conn = sqlite3.connect(DB_FILE)
-    
-    # Check which schema we're using
-    cursor = conn.cursor()
-    cursor.execute("PRAGMA table_info(listening_history)")
-    columns = [col[1] for col in cursor.fetchall()]
-    
-    # Build query based on available columns
+# Columns declared "TEXT NOT NULL UNIQUE" in the table's CREATE statement
+_UNIQUE_RE = re.compile(r'(\w+)\s+TEXT\s+NOT\s+NULL\s+UNIQUE')
+
+# One line of show_schema's column table, from a template parsed once
+SCHEMA_ROW_FMT = "{:<25} {:<15} {:<10} {:<15} {:<5}".format
+
+# Rows fetched and printed at a time, so memory stays bounded for large limits
+FETCH_CHUNK_ROWS = 1000
+
+# Longer cell values are cut to this many characters, ending in '...'
+MAX_COL_WIDTH = 40
+
+# Per-connection SQLite tuning (as in sync_spotify.py); mmap reads pages
+# straight from the OS page cache instead of through read() calls. The journal
+# mode is left to the writers, so viewing doesn't convert the database to WAL
+SQLITE_PRAGMAS = """
+    PRAGMA synchronous=NORMAL;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-20000;
+"""
+
+# The Python formatter for the values SQL can't label
+PLAYED_AT_FALLBACK = "central_time(played_at)"
+
+# The sqlite3 shell (--fast) can't call central_time(), so there UTC ('Z') values are
+# converted in SQL with the US Central DST rules: CDT from 08:00 UTC on the second
+# Sunday of March to 07:00 UTC on the first Sunday of November, CST otherwise
+PLAYED_AT_SHELL_FALLBACK = """
+    CASE
+        WHEN played_at NOT LIKE '%Z' THEN played_at
+        WHEN datetime(played_at) >= datetime(substr(played_at, 1, 4) || '-03-01', 'weekday 0', '+7 days', '+8 hours')
+         AND datetime(played_at) < datetime(substr(played_at, 1, 4) || '-11-01', 'weekday 0', '+7 hours')
+            THEN datetime(played_at, '-5 hours') || ' CDT'
+        ELSE datetime(played_at, '-6 hours') || ' CST'
+    END
+"""
+
+# 'Played At' for display. Values the sync stored in Central time already hold the local
+# time in their first 19 characters and the offset gives the label; UTC ('Z') and other
+# values go through central_time() below
+PLAYED_AT_DISPLAY = f"""
+    CASE substr(played_at, -6)
+        WHEN '-06:00' THEN replace(substr(played_at, 1, 19), 'T', ' ') || ' CST'
+        WHEN '-05:00' THEN replace(substr(played_at, 1, 19), 'T', ' ') || ' CDT'
+        ELSE {PLAYED_AT_FALLBACK}
+    END
+"""
+
+# Columns shown by default (current schema); the IDs are only fetched with --detail
+DISPLAY_COLS = f"""
+    track_name as 'Track',
+    artist_names as 'Artist',
+    album_name as 'Album',
+    release_date as 'Release Date',
+    popularity as 'Popularity',
+    genres as 'Genres',
+    {PLAYED_AT_DISPLAY} as 'Played At',
+    CASE WHEN duration_ms IS NOT NULL
+        THEN printf('%.2f min', duration_ms / 60000.0) END as 'Duration'
+"""
+DETAIL_COLS = """
+    track_id as 'Track ID',
+    artist_ids as 'Artist IDs'
+"""
+LEGACY_DISPLAY_COLS = f"""
+    track as 'Track',
+    artist as 'Artist',
+    album as 'Album',
+    release_date as 'Release Date',
+    popularity as 'Popularity',
+    genres as 'Genres',
+    {PLAYED_AT_DISPLAY} as 'Played At'
+"""
+
+def central_time(played_at):
+    """Format a stored played_at value as Central time (registered as a SQLite function).
+    UTC ('Z') values are converted; naive values are assumed to be Central.
+    """
+    try:
+        dt = datetime.fromisoformat(played_at.replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=CENTRAL_TZ)
+        return dt.astimezone(CENTRAL_TZ).strftime('%Y-%m-%d %H:%M:%S %Z')
+    except Exception:
+        return None
+
+# Connection shared by every call in this process, so the per-connection
+# prepared-statement cache stays warm between calls
+_CONN = None
+
+def _get_conn():
+    """Return the shared connection to the history database, opening it on first use"""
+    global _CONN
+    if _CONN is None:
+        _CONN = sqlite3.connect(DB_FILE, check_same_thread=False)
+        _CONN.row_factory = sqlite3.Row
+        _CONN.executescript(SQLITE_PRAGMAS)
+        _CONN.create_function('central_time', 1, central_time, deterministic=True)
+    return _CONN
+
+@atexit.register
+def _close_conn():
+    """Close the shared connection on exit, so SQLite cleans up its -wal/-shm files"""
+    global _CONN
+    if _CONN is not None:
+        _CONN.close()
+        _CONN = None
+
+def _cell(value):
+    """Display text for one value, cut to MAX_COL_WIDTH"""
+    text = str(value)
+    return text if len(text) <= MAX_COL_WIDTH else text[:MAX_COL_WIDTH - 3] + '...'
+
+def print_rows(column_names, rows, header=True):
+    """Print rows as a left-aligned text table, sized to this batch of rows"""
+    cells = [[_cell(value) for value in row] for row in rows]
+    widths = [max([len(name)] + [len(row[i]) for row in cells]) for i, name in enumerate(column_names)]
+    if header:
+        print("  ".join(name.ljust(width) for name, width in zip(column_names, widths)).rstrip())
+    for row in cells:
+        print("  ".join(text.ljust(width) for text, width in zip(row, widths)).rstrip())
+
+# What the queries need to know about the table's schema: the default select
+# columns, the --detail columns (None if unavailable) and the column that identifies a track
+SchemaPlan = namedtuple('SchemaPlan', ['select_cols', 'detail_cols', 'unique_column'])
+
+def _db_mtime():
+    """Modification times of the database and its WAL file, used to key _schema_plan"""
+    wal_file = DB_FILE + '-wal'
+    return os.path.getmtime(DB_FILE), os.path.getmtime(wal_file) if os.path.exists(wal_file) else None
+
+@lru_cache(maxsize=4)
+def _schema_plan(db_mtime):
+    """Read the listening_history columns and pick the queries' columns for that schema.
+    Cached by db_mtime, so the PRAGMA and the checks only run again once the file changes.
+    """
+    columns = {col[1] for col in _get_conn().execute("PRAGMA table_info(listening_history)")}
     if 'track_name' in columns:
         # New schema
-        select_cols = """
-            track_name as 'Track',
-            artist_names as 'Artist',
-            album_name as 'Album',
-            release_date as 'Release Date',
-            duration_ms as 'Duration (ms)',
-            popularity as 'Popularity',
-            genres as 'Genres',
-            played_at as 'Played At',
-            track_id as 'Track ID',
-            artist_ids as 'Artist IDs'
-        """
-    else:
-        # Old schema (migration)
-        select_cols = """
-            track as 'Track',
-            artist as 'Artist',
-            album as 'Album',
-            release_date as 'Release Date',
-            popularity as 'Popularity',
-            genres as 'Genres',
-            played_at as 'Played At'
-        """
+        return SchemaPlan(DISPLAY_COLS, DETAIL_COLS, 'track_id' if 'track_id' in columns else 'track_name')
+    # Old schema (migration)
+    return SchemaPlan(LEGACY_DISPLAY_COLS, None, 'track')
+
+def _history_query(plan, limit, days, detail):
+    """Build the listing query and its parameters for the given schema plan"""
+    select_cols = plan.select_cols + "," + plan.detail_cols if detail and plan.detail_cols else plan.select_cols
     
     # Build WHERE clause
     where_clause = ""
     params = []
     if days:
         # Calculate cutoff date in Central time
-        central_now = datetime.now(CENTRAL_TZ)
-        cutoff_date = (central_now - pd.Timedelta(days=days)).isoformat()
+        central_now = datetime.now(CENTRAL_TZ).replace(microsecond=0)
+        cutoff_date = (central_now - timedelta(days=days)).isoformat()
         where_clause = "WHERE played_at >= ?"
         params.append(cutoff_date)
     
@@ -73,114 +182,159 @@ def view_database(limit=100, days=None):
         LIMIT ?
     """
     params.append(limit)
+    return query, params
+
+def show_summary_stats(cursor, plan):
+    """Print whole-table statistics: counts, duplicates and the date range"""
+    print("\nSUMMARY STATISTICS:")
+    print("-" * 100)
+    
+    # Every summary number comes from one pass over the table
+    unique_column = plan.unique_column
+    cursor.execute(f"""
+        SELECT COUNT(*),
+               COUNT(*) - COUNT(DISTINCT played_at),
+               COUNT(DISTINCT {unique_column}),
+               MIN(played_at),
+               MAX(played_at)
+        FROM listening_history
+    """)
+    total_count, extra_rows, unique_tracks, min_date, max_date = cursor.fetchone()
+    print(f"Total records in database: {total_count}")
+    
+    # Check for duplicates. Only when some rows share a played_at does it count the
+    # duplicated values (as an aggregate) and fetch a few of them
+    duplicate_count = 0
+    if extra_rows > 0:
+        duplicate_count = cursor.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM listening_history GROUP BY played_at HAVING COUNT(*) > 1
+            )
+        """).fetchone()[0]
+    print(f"Duplicate played_at values: {duplicate_count}")
+    
+    if duplicate_count > 0:
+        print("WARNING: Found duplicates!")
+        cursor.execute("""
+            SELECT played_at, COUNT(*) as count 
+            FROM listening_history 
+            GROUP BY played_at 
+            HAVING COUNT(*) > 1
+            LIMIT 5
+        """)
+        for dup in cursor.fetchall():  # Show first 5
+            print(f"  - {dup[0]}: {dup[1]} occurrences")
+    
+    # Unique tracks
+    if unique_column == 'track_id':
+        print(f"Unique tracks (by track_id): {unique_tracks}")
+    else:
+        print(f"Unique tracks (by name): {unique_tracks}")
+    
+    # Date range
+    if min_date and max_date:
+        print(f"Date range: {min_date} to {max_date}")
+    
+    print("-" * 100)
+
+def view_database(limit=100, days=None, detail=False, stats=False):
+    """View listening history from database.
+    detail=True adds the track and artist ID columns; stats=True also prints
+    the whole-table summary statistics.
+    """
+    
+    if not os.path.exists(DB_FILE):
+        print(f"Database file not found: {DB_FILE}")
+        return
+    
+    conn = _get_conn()
+    
+    # Check which schema we're using
+    cursor = conn.cursor()
+    plan = _schema_plan(_db_mtime())
+    
+    # ORDER BY played_at DESC LIMIT walks the UNIQUE(played_at) index backwards and
+    # stops after `limit` rows instead of sorting the table
+    query, params = _history_query(plan, limit, days, detail)
     
     try:
-        df = pd.read_sql_query(query, conn, params=params)
+        cursor.arraysize = FETCH_CHUNK_ROWS
+        cursor.execute(query, params)
+        rows = cursor.fetchmany()
         
-        if df.empty:
+        if not rows:
             print("No records found in database.")
             return
         
-        # Format the played_at column (handle both UTC and Central time)
-        if 'Played At' in df.columns:
-            # Parse timestamps - handle mixed timezones
-            def parse_timestamp(ts):
-                try:
-                    dt = pd.to_datetime(ts)
-                    # If it ends with 'Z', it's UTC (old format)
-                    if isinstance(ts, str) and ts.endswith('Z'):
-                        if dt.tzinfo is None:
-                            dt = UTC_TZ.localize(dt)
-                        else:
-                            dt = dt.astimezone(UTC_TZ)
-                        # Convert to Central
-                        return dt.astimezone(CENTRAL_TZ)
-                    else:
-                        # Assume Central time (new format)
-                        if dt.tzinfo is None:
-                            return CENTRAL_TZ.localize(dt)
-                        else:
-                            return dt.astimezone(CENTRAL_TZ)
-                except:
-                    return pd.NaT
-            
-            # Apply parsing to handle mixed timezones
-            df['Played At'] = df['Played At'].apply(parse_timestamp)
-            
-            # Format as Central time string
-            df['Played At'] = df['Played At'].dt.strftime('%Y-%m-%d %H:%M:%S %Z')
-        
-        # Format duration
-        if 'Duration (ms)' in df.columns:
-            df['Duration'] = (df['Duration (ms)'] / 1000 / 60).round(2).astype(str) + ' min'
-            df = df.drop('Duration (ms)', axis=1)
+        # Column names come from the query's aliases
+        column_names = [col[0] for col in cursor.description]
         
         # Display statistics
         print("=" * 100)
         print("SPOTIFY LISTENING HISTORY DATABASE")
         print("=" * 100)
-        print(f"\nTotal records shown: {len(df)}")
         if days:
-            print(f"Filter: Last {days} days")
+            print(f"\nFilter: Last {days} days")
         print(f"Database file: {DB_FILE}")
         print("\n" + "=" * 100)
         
-        # Display table
-        pd.set_option('display.max_columns', None)
-        pd.set_option('display.width', None)
-        pd.set_option('display.max_colwidth', 40)
-        print(df.to_string(index=False))
+        # Display table, one chunk of rows at a time (header on the first only)
+        shown_count = 0
+        while rows:
+            print_rows(column_names, rows, header=shown_count == 0)
+            shown_count += len(rows)
+            rows = cursor.fetchmany()
         
+        print(f"\nTotal records shown: {shown_count}")
         print("\n" + "=" * 100)
         
-        # Show summary stats
-        print("\nSUMMARY STATISTICS:")
-        print("-" * 100)
-        
-        # Get total count
-        cursor.execute("SELECT COUNT(*) FROM listening_history")
-        total_count = cursor.fetchone()[0]
-        print(f"Total records in database: {total_count}")
-        
-        # Check for duplicates
-        cursor.execute("""
-            SELECT played_at, COUNT(*) as count 
-            FROM listening_history 
-            GROUP BY played_at 
-            HAVING COUNT(*) > 1
-        """)
-        duplicates = cursor.fetchall()
-        print(f"Duplicate played_at values: {len(duplicates)}")
-        
-        if len(duplicates) > 0:
-            print("WARNING: Found duplicates!")
-            for dup in duplicates[:5]:  # Show first 5
-                print(f"  - {dup[0]}: {dup[1]} occurrences")
-        
-        # Unique tracks
-        if 'track_id' in columns:
-            cursor.execute("SELECT COUNT(DISTINCT track_id) FROM listening_history")
-            unique_tracks = cursor.fetchone()[0]
-            print(f"Unique tracks (by track_id): {unique_tracks}")
-        else:
-            cursor.execute("SELECT COUNT(DISTINCT track) FROM listening_history")
-            unique_tracks = cursor.fetchone()[0]
-            print(f"Unique tracks (by name): {unique_tracks}")
-        
-        # Date range
-        cursor.execute("SELECT MIN(played_at), MAX(played_at) FROM listening_history")
-        min_date, max_date = cursor.fetchone()
-        if min_date and max_date:
-            print(f"Date range: {min_date} to {max_date}")
-        
-        print("-" * 100)
-        
+        # Whole-table stats scan every row, so they only run when asked for
+        if stats:
+            show_summary_stats(cursor, plan)
     except Exception as e:
         print(f"Error reading database: {e}")
         import traceback
         traceback.print_exc()
-    finally:
-        conn.close()
+
+def view_database_fast(limit=100, days=None, detail=False, stats=False):
+    """Print recent history with the sqlite3 command-line shell's table mode.
+    The shell formats the output in C. Falls back to view_database if the shell
+    isn't installed or can't run the query (e.g. a version without table mode);
+    stats=True prints the summary statistics afterwards.
+    """
+    if not os.path.exists(DB_FILE):
+        print(f"Database file not found: {DB_FILE}")
+        return
+    
+    plan = _schema_plan(_db_mtime())
+    query, params = _history_query(plan, limit, days, detail)
+    query = query.replace(PLAYED_AT_FALLBACK, PLAYED_AT_SHELL_FALLBACK)
+    
+    # -bail makes a failed dot-command or query exit non-zero instead of carrying on
+    command = ['sqlite3', '-bail', DB_FILE, '-cmd', '.mode table']
+    # Bind the query's ? parameters (?1, ?2, ... in order) with .parameter set. The value
+    # is a SQL literal; double-quoting it keeps a text literal's single quotes intact
+    for number, param in enumerate(params, 1):
+        if isinstance(param, int):
+            literal = str(param)
+        else:
+            literal = "'" + str(param).replace("'", "''") + "'"
+            literal = '"' + literal.replace('\\', '\\\\').replace('"', '\\"') + '"'
+        command += ['-cmd', f'.parameter set ?{number} {literal}']
+    command.append(query)
+    
+    try:
+        subprocess.run(command, check=True)
+    except FileNotFoundError:
+        print("sqlite3 command-line shell not found, using the regular view")
+        view_database(limit=limit, days=days, detail=detail, stats=stats)
+        return
+    except subprocess.CalledProcessError:
+        print("sqlite3 command-line shell couldn't run the query, using the regular view")
+        view_database(limit=limit, days=days, detail=detail, stats=stats)
+        return
+    if stats:
+        show_summary_stats(_get_conn().cursor(), plan)
 
 def show_schema():
     """Show database schema"""
@@ -188,7 +342,7 @@ def show_schema():
         print(f"Database file not found: {DB_FILE}")
         return
     
-    conn = sqlite3.connect(DB_FILE)
+    conn = _get_conn()
     cursor = conn.cursor()
     
     print("=" * 100)
@@ -200,12 +354,12 @@ def show_schema():
     
     print("\nColumns:")
     print("-" * 100)
-    print(f"{'Column Name':<25} {'Type':<15} {'Not Null':<10} {'Default':<15} {'PK':<5}")
+    print(SCHEMA_ROW_FMT('Column Name', 'Type', 'Not Null', 'Default', 'PK'))
     print("-" * 100)
     
     for col in columns:
         cid, name, col_type, not_null, default, pk = col
-        print(f"{name:<25} {col_type:<15} {'YES' if not_null else 'NO':<10} {str(default) if default else 'None':<15} {'YES' if pk else 'NO':<5}")
+        print(SCHEMA_ROW_FMT(name, col_type, 'YES' if not_null else 'NO', str(default) if default else 'None', 'YES' if pk else 'NO'))
     
     # Check for unique constraints
     print("\n" + "-" * 100)
@@ -215,17 +369,19 @@ def show_schema():
     cursor.execute("PRAGMA index_list(listening_history)")
     indexes = cursor.fetchall()
     
+    # Every index's CREATE statement in one query (NULL for automatic indexes)
+    index_sqls = dict(cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='index'").fetchall())
+    
     for idx in indexes:
         idx_name = idx[1]
-        cursor.execute(f"PRAGMA index_info({idx_name})")
+        cursor.execute(f'PRAGMA index_info("{idx_name}")')
         idx_info = cursor.fetchall()
         if idx_info:
             print(f"Index: {idx_name}")
+            sql = index_sqls.get(idx_name)
             for info in idx_info:
                 col_name = info[2]
-                cursor.execute(f"SELECT sql FROM sqlite_master WHERE name='{idx_name}'")
-                sql = cursor.fetchone()
-                if sql and 'UNIQUE' in sql[0]:
+                if sql and 'UNIQUE' in sql:
                     print(f"  → UNIQUE constraint on: {col_name}")
     
     # Check table creation SQL for UNIQUE
@@ -235,30 +391,43 @@ def show_schema():
         sql = table_sql[0]
         if 'UNIQUE' in sql:
             print("\nUNIQUE constraints in table definition:")
-            import re
-            unique_matches = re.findall(r'(\w+)\s+TEXT\s+NOT\s+NULL\s+UNIQUE', sql)
+            unique_matches = _UNIQUE_RE.findall(sql)
             for match in unique_matches:
                 print(f"  → {match} (UNIQUE)")
-    
-    conn.close()
 
 if __name__ == '__main__':
     import sys
     
-    if len(sys.argv) > 1:
-        if sys.argv[1] == '--schema':
+    args = sys.argv[1:]
+    # --detail, --fast and --stats can go anywhere on the command line
+    detail = '--detail' in args
+    if detail:
+        args.remove('--detail')
+    fast = '--fast' in args
+    if fast:
+        args.remove('--fast')
+    stats = '--stats' in args
+    if stats:
+        args.remove('--stats')
+    view = view_database_fast if fast else view_database
+    
+    if len(args) > 0:
+        if args[0] == '--schema':
             show_schema()
-        elif sys.argv[1] == '--days' and len(sys.argv) > 2:
-            days = int(sys.argv[2])
-            limit = int(sys.argv[3]) if len(sys.argv) > 3 else 100
-            view_database(limit=limit, days=days)
-        elif sys.argv[1].isdigit():
-            view_database(limit=int(sys.argv[1]))
+        elif args[0] == '--days' and len(args) > 1:
+            days = int(args[1])
+            limit = int(args[2]) if len(args) > 2 else 100
+            view(limit=limit, days=days, detail=detail, stats=stats)
+        elif args[0].isdigit():
+            view(limit=int(args[0]), detail=detail, stats=stats)
         else:
             print("Usage:")
             print("  python view_database.py              # View last 100 records")
             print("  python view_database.py 50          # View last 50 records")
             print("  python view_database.py --days 7 50 # View last 50 records from past 7 days")
             print("  python view_database.py --schema    # Show database schema")
+            print("  python view_database.py 50 --detail # Also show track and artist IDs")
+            print("  python view_database.py 50 --fast   # Print with the sqlite3 shell")
+            print("  python view_database.py 50 --stats  # Also show whole-table summary statistics")
     else:
-        view_database()
+        view(detail=detail, stats=stats)